@@ -1,121 +1,310 @@
-from flask import Flask, render_template, request, jsonify
-import os, time, logging, threading, multiprocessing
+if __name__ == "__main__":
+    # Patch the stdlib before anything below creates sockets or locks
+    from gevent import monkey
+    monkey.patch_all()
+
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.middleware.proxy_fix import ProxyFix
+import os, re, time, math, zlib, queue, logging, importlib, threading
+from collections import OrderedDict
 from functools import wraps
 from dotenv import load_dotenv
+from flask_compress import Compress
+from cachetools import TTLCache
+import httpx
+import orjson
 from google import genai
 from google.genai import types
 
+try:
+    import pyttsx3
+except ImportError:  # TTS is optional; answers are still returned as text
+    pyttsx3 = None
+
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider using orjson for jsonify() and request.get_json()"""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # Hand orjson's bytes straight to the response, skipping the str round-trip
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj, default=self.default), mimetype=self.mimetype)
+
 load_dotenv()
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
+
+# Behind a reverse proxy (e.g. the Heroku router) every request arrives from the
+# proxy's address, which would put all clients in one rate-limit bucket. Set
+# TRUST_PROXY_HOPS to the number of proxies in front of the app to take the
+# client address from X-Forwarded-For instead.
+TRUST_PROXY_HOPS = int(os.getenv("TRUST_PROXY_HOPS", "0"))
+if TRUST_PROXY_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUST_PROXY_HOPS)
+
+# Compress JSON replies; favour speed over ratio since every reply is fresh.
+# Streams are left to stream_response(), which gzips frame by frame.
+COMPRESS_LEVEL = 4
+app.config['COMPRESS_MIMETYPES'] = ['application/json']
+app.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+app.config['COMPRESS_LEVEL'] = COMPRESS_LEVEL
+app.config['COMPRESS_BR_LEVEL'] = COMPRESS_LEVEL
+app.config['COMPRESS_STREAMS'] = False
+Compress(app)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize Gemini client
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+# Initialize Gemini client once; its HTTP/2 connection pool is shared by all requests
+client = genai.Client(
+    api_key=os.getenv("GEMINI_API_KEY"),
+    http_options=types.HttpOptions(
+        timeout=30000,  # milliseconds
+        # Transient failures are retried on the pooled connection before surfacing
+        retry_options=types.HttpRetryOptions(
+            attempts=3,
+            initial_delay=0.2,
+            http_status_codes=[429, 500, 502, 503, 504],
+        ),
+        client_args={
+            'http2': True,
+            'limits': httpx.Limits(max_keepalive_connections=50),
+        },
+    ),
+)
+
+# Model and Google Search grounding config are immutable, so build them once
+GEMINI_MODEL = "gemini-2.0-flash-exp"
+GROUNDING_TOOL = types.Tool(google_search=types.GoogleSearch())
+GEN_CONFIG = types.GenerateContentConfig(
+    tools=[GROUNDING_TOOL],
+    temperature=0.7
+)
 
-# TTS process management
-tts_process = None
-tts_lock = threading.Lock()
+# Recent answers keyed by normalized question, so repeats skip Gemini entirely
+response_cache = TTLCache(maxsize=512, ttl=300)
+response_cache_lock = threading.RLock()
 
-def speak_in_process(text):
-    """Function to run TTS in separate process"""
+def normalize_question(question):
+    """Cache key for a question: lowercased with whitespace collapsed"""
+    return " ".join(question.lower().split())
+
+def native(module, name):
+    """The stdlib object as it was before gevent's monkey-patching (if any)"""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return getattr(importlib.import_module(module), name)
+    return monkey.get_original(module, name)
+
+# TTS worker management. pyttsx3's runAndWait() blocks in C, so the worker must be
+# a real OS thread and the state it shares with request greenlets must use real
+# locks and queues; otherwise one utterance would stall every request under gevent.
+SENTENCE_SPLIT = re.compile(r'(?<=[.!?])\s+')
+# Code, URLs and markdown markup are slow to synthesize and useless to hear
+SPEAK_CLEAN = re.compile(r'```.*?```|`[^`]*`|https?://\S+|[#*_>]+', re.S)
+MAX_SPEAK_CHARS = 300
+TTS_QUEUE_SIZE = 64
+tts_engine = None
+tts_started = False
+tts_available = True
+tts_queue = native('queue', 'SimpleQueue')()
+tts_generation = 0  # Bumped on every stop; queued sentences from older generations are skipped
+tts_lock = native('_thread', 'RLock')()  # Only ever held briefly, never across runAndWait()
+
+def tts_worker():
+    """Background thread: initialize the engine once and speak queued sentences"""
+    global tts_engine, tts_available
+    if pyttsx3 is None:
+        logger.warning("TTS disabled: pyttsx3 is not installed")
+        tts_available = False
+        return
     try:
-        import pyttsx3
         engine = pyttsx3.init()
-        engine.say(text)
-        engine.runAndWait()
-        engine.stop()
     except Exception as e:
-        logger.warning(f"TTS error: {e}")
+        logger.warning(f"TTS init error: {e}")
+        tts_available = False
+        return
+    tts_engine = engine
+
+    while True:
+        generation, text = tts_queue.get()
+        try:
+            # Check and queue the utterance atomically with stop_tts(): a stop that
+            # lands before runAndWait() then clears it from the engine's queue
+            with tts_lock:
+                if generation != tts_generation:
+                    continue
+                engine.say(text)
+            engine.runAndWait()
+        except Exception as e:
+            logger.warning(f"TTS error: {e}")
 
-def start_tts(text):
-    """Start TTS in new process"""
-    global tts_process
+def ensure_tts_worker():
+    """Start the TTS thread on first use; returns False if TTS is unavailable"""
+    global tts_started
+    if not tts_started:
+        tts_started = True
+        native('_thread', 'start_new_thread')(tts_worker, ())
+    return tts_available
+
+def start_tts(sentences=()):
+    """Replace whatever is being spoken with sentences; returns the new generation"""
+    with tts_lock:
+        stop_tts()
+        queue_tts(sentences, tts_generation)
+        return tts_generation
+
+def queue_tts(sentences, generation):
+    """Append sentences to generation's utterance, unless it has been stopped since"""
     with tts_lock:
-        stop_tts()  # Stop any existing TTS
-        tts_process = multiprocessing.Process(target=speak_in_process, args=(text,))
-        tts_process.daemon = True
-        tts_process.start()
+        if generation != tts_generation or not ensure_tts_worker():
+            return
+        for sentence in sentences:
+            if tts_queue.qsize() >= TTS_QUEUE_SIZE:
+                break  # TTS is best-effort; drop the rest rather than pile up
+            tts_queue.put_nowait((generation, sentence))
 
 def stop_tts():
-    """Stop current TTS process"""
-    global tts_process
-    if tts_process and tts_process.is_alive():
-        tts_process.terminate()
-        tts_process.join(timeout=1)
-        if tts_process.is_alive():
-            tts_process.kill()
-        tts_process = None
-
-def get_gemini_response_with_sources(question):
-    """Get response from Gemini with Google Search grounding"""
-    try:
-        # Configure grounding tool
-        grounding_tool = types.Tool(google_search=types.GoogleSearch())
-        
-        config = types.GenerateContentConfig(
-            tools=[grounding_tool],
-            temperature=0.7
-        )
-        
-        # Generate response
-        response = client.models.generate_content(
-            model="gemini-2.0-flash-exp",
-            contents=question,
-            config=config
-        )
-        
-        # Extract response text
-        response_text = response.text
-        
-        # Extract source links from grounding metadata
-        sources = []
-        if (response.candidates and 
-            len(response.candidates) > 0 and 
-            hasattr(response.candidates[0], 'grounding_metadata') and
-            response.candidates[0].grounding_metadata):
-            
-            grounding_data = response.candidates[0].grounding_metadata
-            
-            if hasattr(grounding_data, 'grounding_chunks'):
-                for chunk in grounding_data.grounding_chunks:
-                    if hasattr(chunk, 'web') and chunk.web:
-                        sources.append({
-                            'title': getattr(chunk.web, 'title', 'Source'),
-                            'url': getattr(chunk.web, 'uri', '')
-                        })
-                        if len(sources) >= 3:  # Limit to 3 sources
-                            break
-        
-        return {
-            'response': response_text,
-            'sources': sources
-        }
-        
-    except Exception as e:
-        logger.error(f"Gemini error: {e}")
-        return {
-            'response': f"⚠️ Error: {str(e)}",
-            'sources': []
-        }
-
-def rate_limit(max_per_second=3):
-    """Rate limiting decorator"""
+    """Interrupt the current utterance and drop anything still queued"""
+    global tts_generation
+    with tts_lock:
+        tts_generation += 1
+        while True:
+            try:
+                tts_queue.get_nowait()
+            except queue.Empty:
+                break
+        if tts_engine is not None:
+            tts_engine.stop()  # Safe to call from another thread; ends runAndWait() early
+
+class SpeechFeed:
+    """Speaks streamed answer text a sentence at a time as it arrives"""
+
+    def __init__(self):
+        self.pending = ''
+        self.budget = MAX_SPEAK_CHARS
+        self.generation = None
+
+    def feed(self, text):
+        """Add text; every sentence it completes is queued for TTS"""
+        self.pending += text
+        *sentences, rest = SENTENCE_SPLIT.split(self.pending)
+        done = ' '.join(sentences)
+        if done.count('```') % 2:
+            return  # Inside a code fence; wait until it closes so it's stripped whole
+        self.pending = rest
+        self.speak(done)
+
+    def finish(self):
+        """Speak whatever is left once the answer is complete"""
+        self.speak(self.pending)
+        self.pending = ''
+
+    def speak(self, text):
+        # Code, URLs and markup are stripped and the total is capped at MAX_SPEAK_CHARS
+        spoken = []
+        for sentence in SENTENCE_SPLIT.split(SPEAK_CLEAN.sub('', text)):
+            sentence = sentence.strip()[:self.budget]
+            if sentence:
+                self.budget -= len(sentence)
+                spoken.append(sentence)
+        if not spoken:
+            return
+        # TTS is best-effort: a speech failure must never break the streamed reply
+        try:
+            if self.generation is None:
+                self.generation = start_tts(spoken)  # First sentence interrupts the previous answer
+            else:
+                queue_tts(spoken, self.generation)
+        except Exception as e:
+            logger.warning(f"TTS error: {e}")
+
+def extract_sources(response, limit=3):
+    """Collect up to limit web sources from a response's grounding metadata"""
+    # google-genai responses are pydantic models: every field exists and
+    # defaults to None, so plain attribute access replaces hasattr probing
+    sources = []
+    for candidate in response.candidates or ():
+        metadata = candidate.grounding_metadata
+        if metadata is None:
+            continue
+        for chunk in metadata.grounding_chunks or ():
+            web = chunk.web
+            if web:
+                sources.append({
+                    'title': web.title or 'Source',
+                    'url': web.uri or ''
+                })
+                if len(sources) >= limit:
+                    return sources
+    return sources
+
+def stream_gemini_response_with_sources(question):
+    """Yield (text, sources) pieces of a Gemini answer with Google Search grounding"""
+    for chunk in client.models.generate_content_stream(
+        model=GEMINI_MODEL,
+        contents=question,
+        config=GEN_CONFIG
+    ):
+        # Grounding metadata usually arrives on the final chunk
+        yield chunk.text or '', extract_sources(chunk)
+
+class TokenBucket:
+    """Thread-safe token bucket used for per-client rate limiting"""
+
+    def __init__(self, capacity, refill_rate):
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.tokens = float(capacity)
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, n=1):
+        """Take n tokens; return 0 on success, else seconds until n are available"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.refill_rate)
+            self.last_refill = now
+            if self.tokens >= n:
+                self.tokens -= n
+                return 0
+            return (n - self.tokens) / self.refill_rate
+
+def rate_limit(max_per_second=3, burst=None, max_clients=10000):
+    """Per-client token bucket rate limiting decorator (rejects with 429)"""
     def decorator(f):
-        f.last_called = 0
-        f.min_interval = 1.0 / max_per_second
-        
+        buckets = OrderedDict()
+        buckets_lock = threading.Lock()
+        capacity = burst or max_per_second
+
+        def get_bucket(key):
+            with buckets_lock:
+                bucket = buckets.get(key)
+                if bucket is None:
+                    bucket = buckets[key] = TokenBucket(capacity, max_per_second)
+                    if len(buckets) > max_clients:
+                        buckets.popitem(last=False)  # Evict least recently used client
+                else:
+                    buckets.move_to_end(key)
+                return bucket
+
         @wraps(f)
         def wrapper(*args, **kwargs):
-            elapsed = time.time() - f.last_called
-            left_to_wait = f.min_interval - elapsed
-            if left_to_wait > 0:
-                time.sleep(left_to_wait)
-            ret = f(*args, **kwargs)
-            f.last_called = time.time()
-            return ret
+            # remote_addr is the real client only with TRUST_PROXY_HOPS set behind a proxy
+            retry_after = get_bucket(request.remote_addr).consume()
+            if retry_after:
+                response = jsonify({"error": "rate limited"})
+                response.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+                return response, 429
+            return f(*args, **kwargs)
         return wrapper
     return decorator
 
@@ -123,33 +312,116 @@ def rate_limit(max_per_second=3):
 def home():
     return render_template("index.html")
 
-@app.route("/ask", methods=["POST"])
+def ndjson(frame):
+    """Encode one frame of a streamed /ask reply"""
+    return orjson.dumps(frame) + b"\n"
+
+def gzip_frames(frames):
+    """gzip a frame stream, flushing after each frame so the client can decode as it goes"""
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for frame in frames:
+        yield compressor.compress(frame) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+def stream_response(frames):
+    """Stream NDJSON frames: {"chunk": text}... then {"done": true, "sources": [...]} or {"error": message}"""
+    gzip = bool(request.accept_encodings['gzip'])
+    response = Response(
+        stream_with_context(gzip_frames(frames) if gzip else frames),
+        mimetype="application/x-ndjson"
+    )
+    response.vary.add('Accept-Encoding')
+    if gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+def replay_cached(result):
+    """Frames for a cached answer, spoken like a fresh one"""
+    speech = SpeechFeed()
+    speech.feed(result['response'])
+    speech.finish()
+    yield ndjson({"chunk": result['response']})
+    yield ndjson({"done": True, "sources": result['sources'], "timestamp": time.time()})
+
+def stream_answer(question, key):
+    """Frames relayed from Gemini as they arrive; complete answers are cached"""
+    parts, sources = [], []
+    speech = SpeechFeed()
+    chunks = stream_gemini_response_with_sources(question)
+    while True:
+        try:
+            text, chunk_sources = next(chunks)
+        except StopIteration:
+            break
+        except Exception as e:
+            # Gemini failed mid-answer: report it and end without a done frame
+            logger.error(f"Gemini error: {e}")
+            yield ndjson({"error": f"⚠️ Error: {str(e)}"})
+            return
+        if text:
+            parts.append(text)
+            speech.feed(text)
+            yield ndjson({"chunk": text})
+        sources.extend(chunk_sources[:3 - len(sources)])
+
+    speech.finish()
+    if parts:
+        with response_cache_lock:
+            response_cache[key] = {'response': ''.join(parts), 'sources': sources}
+    yield ndjson({"done": True, "sources": sources, "timestamp": time.time()})
+
 @rate_limit(max_per_second=3)
+def answer_uncached(question, key):
+    """Stream a fresh answer from Gemini (rate limited)"""
+    return stream_response(stream_answer(question, key))
+
+MAX_BODY_BYTES = 2048
+MAX_QUESTION_CHARS = 500
+# Werkzeug stops reading chunked bodies (no Content-Length) at this limit without
+# raising, so allow one extra byte: a body longer than MAX_BODY_BYTES means truncation
+app.config['MAX_CONTENT_LENGTH'] = MAX_BODY_BYTES + 1
+
+def ask_error(message, status):
+    """Error reply for /ask in the shape the chat UI renders"""
+    return jsonify({"response": f"⚠️ {message}", "sources": []}), status
+
+@app.route("/ask", methods=["POST"])
 def ask():
     try:
+        # Fast path: shed oversized payloads before reading the body
+        if (request.content_length or 0) > MAX_BODY_BYTES:
+            return ask_error("Message too long. Please keep it under 500 characters.", 413)
+        
         if not request.is_json:
             return jsonify({"error": "Content-Type must be application/json"}), 400
         
-        data = request.get_json()
-        question = data.get("message", "").strip()
+        raw = request.get_data(cache=False)
+        if len(raw) > MAX_BODY_BYTES:
+            return ask_error("Message too long. Please keep it under 500 characters.", 413)
         
-        if not question:
-            return jsonify({"response": "⚠️ No question received.", "sources": []}), 400
+        try:
+            data = orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            return ask_error("Invalid JSON body.", 400)
+        
+        question = data.get("message") if isinstance(data, dict) else None
+        if question:
+            question = question.strip() if isinstance(question, str) else None
         
-        if len(question) > 500:
-            return jsonify({"response": "⚠️ Message too long. Please keep it under 500 characters.", "sources": []}), 400
+        if not question:
+            return ask_error("No question received.", 400)
         
-        # Get response with sources
-        result = get_gemini_response_with_sources(question)
+        if len(question) > MAX_QUESTION_CHARS:
+            return ask_error("Message too long. Please keep it under 500 characters.", 400)
         
-        # Start TTS in background
-        threading.Thread(target=start_tts, args=(result['response'],), daemon=True).start()
+        # Cache hits don't touch Gemini, so they don't count against the rate limit
+        key = normalize_question(question)
+        with response_cache_lock:
+            cached = response_cache.get(key)
+        if cached is not None:
+            return stream_response(replay_cached(cached))
         
-        return jsonify({
-            "response": result['response'],
-            "sources": result['sources'],
-            "timestamp": time.time()
-        })
+        return answer_uncached(question, key)
         
     except Exception as e:
         logger.error(f"Error in /ask endpoint: {e}")
@@ -174,4 +446,8 @@ def internal_error(error):
     return jsonify({"error": "Internal server error"}), 500
 
 if __name__ == "__main__":
-    app.run(debug=True, threaded=True)
+    # Production: gunicorn -k gevent -w 1 -b 0.0.0.0:5000 app:app
+    # Keep a single worker: TTS, the rate limiter and the answer cache all live in-process
+    from gevent.pywsgi import WSGIServer
+    logger.info("Serving on http://0.0.0.0:5000")
+    WSGIServer(('0.0.0.0', 5000), app).serve_forever()
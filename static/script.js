@@ -219,14 +219,29 @@ class ChatInterface {
                     // Show typing indicator
                     this.showTypingIndicator();
 
-                    // Get bot response
-                    const result = await this.getBotResponse(messageData.content);
+                    // Stream bot response, showing text as soon as the first chunk arrives
+                    let messageElement = null;
+                    const result = await this.getBotResponse(messageData.content, (text) => {
+                        if (!messageElement) {
+                            this.hideTypingIndicator();
+                            messageElement = this.displayBotMessage(text);
+                        } else {
+                            this.updateBotMessage(messageElement, text);
+                        }
+                    });
 
                     // Hide typing indicator
                     this.hideTypingIndicator();
 
-                    // Display bot response with proper formatting and sources
-                    this.displayBotMessage(result.response, result.sources);
+                    // Display final bot response with proper formatting and sources
+                    if (result.error) {
+                        // Any partial answer stays on screen; the error follows as its own message
+                        this.displayBotMessage(result.error);
+                    } else if (messageElement) {
+                        this.updateBotMessage(messageElement, result.response, result.sources);
+                    } else {
+                        this.displayBotMessage(result.response, result.sources);
+                    }
                 }
             }
         } catch (error) {
@@ -249,6 +264,14 @@ class ChatInterface {
         const messageElement = this.createMessageElement('bot', message, sources);
         this.chatMessages.appendChild(messageElement);
         this.scrollToBottom();
+        return messageElement;
+    }
+
+    updateBotMessage(messageElement, message, sources = []) {
+        // Re-render in place as more of the streamed response arrives
+        const updated = this.createMessageElement('bot', message, sources);
+        messageElement.replaceChildren(...updated.childNodes);
+        this.scrollToBottom();
     }
 
     createMessageElement(sender, content, sources = []) {
@@ -362,7 +385,7 @@ class ChatInterface {
         container.appendChild(sourcesContainer);
     }
 
-    async getBotResponse(message) {
+    async getBotResponse(message, onChunk = () => {}) {
         try {
             const response = await fetch('/ask', {
                 method: 'POST',
@@ -376,15 +399,52 @@ class ChatInterface {
                 throw new Error(`HTTP error! status: ${response.status}`);
             }
 
-            const data = await response.json();
+            // The reply is newline-delimited JSON: {"chunk": ...} frames, then
+            // {"done": true, "sources": [...]} on success or {"error": ...} on failure
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let text = '';
+            let sources = [];
+            let finished = false;
+            let errorMessage = null;
+
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+
+                buffer += decoder.decode(value, { stream: true });
+                const lines = buffer.split('\n');
+                buffer = lines.pop();
+
+                lines.filter(line => line.trim()).forEach(line => {
+                    const frame = JSON.parse(line);
+                    if (frame.chunk) {
+                        text += frame.chunk;
+                        onChunk(text);
+                    }
+                    if (frame.error) {
+                        errorMessage = frame.error;
+                    }
+                    if (frame.done) {
+                        finished = true;
+                        sources = frame.sources || [];
+                    }
+                });
+            }
+
+            if (errorMessage) {
+                return { response: text, sources: [], error: errorMessage };
+            }
 
-            if (data.error) {
-                throw new Error(data.error);
+            // Without a done frame the stream was cut off, so the answer is incomplete
+            if (!finished) {
+                throw new Error('Response stream ended before it was complete');
             }
 
             return {
-                response: data.response || 'I received your message but couldn\'t generate a response.',
-                sources: data.sources || []
+                response: text || 'I received your message but couldn\'t generate a response.',
+                sources: sources
             };
         } catch (error) {
             console.error('Error getting bot response:', error);